@@ -2,13 +2,64 @@
 This is a template bot for the CAPM Task.
 """
 
-import copy
+import time
 from typing import List
+
+import numpy as np
 from fmclient import Agent, Session, Order, OrderSide, OrderType, Market
+from numba import njit
+from scipy.linalg.blas import dsymv
 
 # Submission details
 SUBMISSION = {"number": , "name": }
 
+# Change in asset holdings for each order side (cash changes by -sign * price)
+_BUY_SIGN = 1
+_SELL_SIGN = -1
+_SIGN_BY_SIDE = {OrderSide.BUY: _BUY_SIGN, OrderSide.SELL: _SELL_SIGN}
+_SIDE_BY_SIGN = {_BUY_SIGN: OrderSide.BUY, _SELL_SIGN: OrderSide.SELL}
+
+# Smallest marginal performance (in dollars) treated as an improvement, so break-even trades are not sent due to
+# floating point error
+_MIN_MARGIN = 1e-9
+
+# Label of each order side used when informing the user
+_SIDE_LABEL = {OrderSide.BUY: "BUY", OrderSide.SELL: "SELL"}
+
+
+@njit(cache=True, fastmath=True)
+def _best_candidate(mu, risk_vec_buy, risk_vec_sell, buy_prices, buy_valid, sell_prices, sell_valid):
+    """
+    Finds the single unit trade with the highest marginal portfolio performance. Trading s units (+1 buy, -1 sell) of
+    security i at price p changes performance by s * (mu[i] - p) - rp * (2 * s * (Cov @ h)[i] + Cov[i, i])
+    :param mu: Expected return of each security (in dollars)
+    :param risk_vec_buy: Increase in the risk penalty from buying 1 unit of each security
+    :param risk_vec_sell: Increase in the risk penalty from selling 1 unit of each security
+    :param buy_prices: Price (in cents) at which 1 unit of each security can be bought
+    :param buy_valid: True for securities where the buy trade is valid
+    :param sell_prices: Price (in cents) at which 1 unit of each security can be sold
+    :param sell_valid: True for securities where the sell trade is valid
+    :return: Tuple (marginal performance, side, index). Side is +1 for a buy, -1 for a sell, and 0 if no trade is valid
+    """
+
+    best_margin = 0.0
+    best_side = 0
+    best_idx = -1
+
+    for i in range(mu.shape[0]):
+        if buy_valid[i]:
+            margin = mu[i] - buy_prices[i] * 0.01 - risk_vec_buy[i]
+            if best_side == 0 or margin > best_margin:
+                best_margin, best_side, best_idx = margin, _BUY_SIGN, i
+
+    for i in range(mu.shape[0]):
+        if sell_valid[i]:
+            margin = sell_prices[i] * 0.01 - mu[i] - risk_vec_sell[i]
+            if best_side == 0 or margin > best_margin:
+                best_margin, best_side, best_idx = margin, _SELL_SIGN, i
+
+    return best_margin, best_side, best_idx
+
 
 class CAPMBot(Agent):
 
@@ -29,40 +80,71 @@ class CAPMBot(Agent):
         self._payoffs = {}
         self._risk_penalty = risk_penalty
         self._session_time = session_time
-        self._market_ids = {}
+        self._markets_by_sec = {}
         self._price_tick = {}
+        self._price_floor = {}
+        self._price_ceiling = {}
 
-        # Information on bot performance
+        # Information on bot performance, and the cash and asset holdings it was last calculated for
         self._current_performance = None
+        self._perf_cache_key = None
+        self._perf_cache_val = None
 
         # Information on cash (in cents), asset holdings, and asset holdings including amount that can be shorted
         self._cash_holdings = None
         self._asset_holdings = {}
         self._short_asset_holdings = {}
 
+        # Ordering of securities used by the array representations of holdings, expected returns, and covariances
+        self._securities = []
+        self._sec_index = {}
+        self._h_vec = None
+        self._short_vec = None
+
         # Information on individual asset expected returns, variance, and covariance
-        self._asset_expected_returns = None
-        self._asset_variance_covariance_matrix = None
+        self._mu = None
+        self._cov = None
+        self._diag = None
+
+        # Price floor, ceiling, and tick of each security indexed by position in self._securities
+        self._floor_vec = None
+        self._ceiling_vec = None
+        self._tick_vec = None
+
+        # Information on the current portfolio (covariance-weighted holdings, expected return of asset holdings, and
+        # payoff variance) used to calculate current performance and the risk of single unit trades
+        self._cov_h = None
+        self._base_expected_return = None
+        self._base_variance = None
+
+        # Increase in the risk penalty from buying or selling 1 unit of each security
+        self._risk_vec_buy = None
+        self._risk_vec_sell = None
 
         # Information on current most performance enhancing valid market trade
         self._most_enhancing_trade = None
 
         # Information on maximum wait time before taking market making action or canceling orders
         self._max_wait_time = None
-        self._current_wait_time = 0
+        self._last_action_time = time.monotonic()
 
-        # Information on if a order sent by the bot currently exists on the order book
+        # Information on if a order sent by the bot currently exists on the order book, the accepted orders sent by the
+        # bot that are still open (with order id as keys and order as values), and the ids of traded orders sent by the
+        # bot (a trade can be received before the order is accepted)
         self._order_on_market = False
+        self._my_open_orders = {}
+        self._my_traded_order_ids = set()
 
     def initialised(self):
 
-        # Extract payoff distribution, market id, and price tick for each security
+        # Extract payoff distribution, market, price tick, and price floor/ceiling for each security
         for market_id, market_info in self.markets.items():
             security = market_info.item
             description = market_info.description
-            self._payoffs[security] = [int(a) for a in description.split(",")]
-            self._market_ids[security] = market_id
+            self._payoffs[security] = np.array(description.split(","), dtype=np.int32)
+            self._markets_by_sec[security] = Market(market_id)
             self._price_tick[security] = market_info.price_tick
+            self._price_floor[security], self._price_ceiling[security] = market_info.min_price, market_info.max_price
 
     def get_potential_performance(self, orders):
         """
@@ -73,144 +155,75 @@ class CAPMBot(Agent):
         :return: Portfolio performance given orders are executed
         """
 
-        # The expected payoff and payoff variance (rescaled to dollar terms)
-        curr_asset_holdings = self._asset_holdings.copy()
-        expected_payoff = self._cash_holdings / 100
-        payoff_variance = 0
+        # Cash (in cents) after the orders are executed. Hypothetical asset holdings are applied to the holdings
+        # vector in place and reverted before returning
+        h = self._h_vec
+        cash_cents = self._cash_holdings
+        applied_deltas = []
 
-        # Updating hypothetical asset holdings and purchase/sell price for given list of orders
-        for order in orders:
+        try:
+            # Updating hypothetical asset holdings and purchase/sell price for given list of orders
+            for order in orders:
+                sec_idx = self._sec_index[order.ref]
+                sign = _SIGN_BY_SIDE[order.order_side]
 
-            if order.order_side == OrderSide.SELL:
-                curr_asset_holdings[order.ref] -= 1
-                expected_payoff += order.price / 100
+                h[sec_idx] += sign
+                applied_deltas.append((sec_idx, sign))
+                cash_cents -= sign * order.price
 
-            if order.order_side == OrderSide.BUY:
-                curr_asset_holdings[order.ref] += 1
-                expected_payoff -= order.price / 100
+            # Portfolio expected payoff (rescaled to dollar terms)
+            expected_payoff = cash_cents * 0.01 + self._mu @ h
 
-        # Portfolio expected return
-        for security, holdings in curr_asset_holdings.items():
-            expected_payoff += self._asset_expected_returns[security] * holdings
+            # Payoff variance does not affect performance of a risk neutral bot
+            if self._risk_penalty == 0:
+                return expected_payoff
 
-        # Portfolio payoff variance (payoff variance weights is on number of securities held, not percentage of total
-        # portfolio)
-        for security_1, holdings_1 in curr_asset_holdings.items():
-            for security_2, holdings_2 in curr_asset_holdings.items():
-                curr_matrix_key = (security_1, security_2)
-                payoff_variance += holdings_1 * holdings_2 * self._asset_variance_covariance_matrix[curr_matrix_key]
+            # Portfolio payoff variance (payoff variance weights is on number of securities held, not percentage of
+            # total portfolio)
+            payoff_variance = h @ dsymv(1.0, self._cov, h, lower=1)
+
+        finally:
+            for sec_idx, delta in applied_deltas:
+                h[sec_idx] -= delta
 
         return expected_payoff - (self._risk_penalty * payoff_variance)
 
-    def is_portfolio_optimal(self):
+    def is_portfolio_optimal(self, snapshot):
         """
         Returns true if the current holdings are optimal with respect to current best bid/ask (as per the performance
         formula), false otherwise. Mutates the variable self._most_enhancing_trade with the most performance enhancing
         valid trade if holdings are not optimal
+        :param snapshot: List of (order id, order) pairs of the current order book
         :return: Return True if current holdings are optimal, False otherwise
         """
 
         # Find best bid/ask price for each market
-        best_bid_dict = {}
-        best_ask_dict = {}
-
-        for order_id, order in Order.current().items():
-            security = order.market.item
-            price = order.price
-
-            if order.order_side == OrderSide.SELL:
-                if best_ask_dict.get(security) is None:
-                    best_ask_dict[security] = price
-                else:
-                    if price < best_ask_dict[security]:
-                        best_ask_dict[security] = price
-
-            if order.order_side == OrderSide.BUY:
-                if best_bid_dict.get(security) is None:
-                    best_bid_dict[security] = price
-                else:
-                    if price > best_bid_dict[security]:
-                        best_bid_dict[security] = price
-
-        # Finds all performance increasing market price trades (with performance as keys and order as values)
-        optimal_trades = {}
-
-        # Determines if buying 1 more security at the market price increases performance
-        for security, price in best_ask_dict.items():
-
-            buy_order = Order.create_new()
-            buy_order.price = price
-            buy_order.order_side = OrderSide.BUY
-            buy_order.ref = security
-
-            performance = self.get_potential_performance([buy_order])
-            if performance > self._current_performance:
-                optimal_trades[performance] = buy_order
-
-        # Determines if selling 1 more security at the market price increases performance
-        for security, price in best_bid_dict.items():
-
-            sell_order = Order.create_new()
-            sell_order.price = price
-            sell_order.order_side = OrderSide.SELL
-            sell_order.ref = security
-
-            performance = self.get_potential_performance([sell_order])
-            if performance > self._current_performance:
-                optimal_trades[performance] = sell_order
-
-        # Finds the best performance enhancing trade that satisfies order validity if there are any
-        if len(optimal_trades) != 0:
-
-            best_market_performance = 0
-            best_market_trade = None
-
-            for performance, trade in optimal_trades.items():
-                if performance > best_market_performance:
+        best_bid_dict, best_ask_dict = self._best_bid_ask(snapshot)
 
-                    # Populates the rest of the parameters for the order
-                    trade.market = Market(self._market_ids[trade.ref])
-                    trade.order_type = OrderType.LIMIT
-                    trade.units = 1
+        # Buy at the best ask or sell at the best bid of each security that has orders on the order book
+        buy_prices, buy_available = self._price_vector(best_ask_dict)
+        sell_prices, sell_available = self._price_vector(best_bid_dict)
 
-                    # Checking for order validity
-                    valid_order = self._check_order_validity(trade)
-
-                    if valid_order:
-
-                        best_market_performance = performance
-                        best_market_trade = trade
-
-            if best_market_trade is not None:
-                self._most_enhancing_trade = best_market_trade
-                return False
-
-        self._most_enhancing_trade = None
-        return True
+        return self._select_trade(buy_prices, buy_available, sell_prices, sell_available)
 
     def order_accepted(self, order):
 
-        # Find the order type of the order (i.e. BUY, SELL, or CANCEL order)
-        if order.order_side == OrderSide.BUY:
-            order_type = "BUY"
-        else:
-            order_type = "SELL"
-
+        # Find the order type of the order (i.e. BUY, SELL, or CANCEL order) and keep track of open orders sent by the
+        # bot
         if order.order_type == OrderType.CANCEL:
             order_type = "CANCEL"
+            self._my_open_orders.pop(order.fm_id, None)
+        else:
+            order_type = _SIDE_LABEL[order.order_side]
+            if order.fm_id not in self._my_traded_order_ids:
+                self._my_open_orders[order.fm_id] = order
 
         self.inform(f"A {order_type} order is ACCEPTED for security {order.market.item} for 1 unit @ {order.price}")
 
     def order_rejected(self, info, order):
 
         # Find the order type of the order (i.e. BUY, SELL, or CANCEL order)
-        if order.order_side == OrderSide.BUY:
-            order_type = "BUY"
-        else:
-            order_type = "SELL"
-
-        if order.order_type == OrderType.CANCEL:
-            order_type = "CANCEL"
+        order_type = "CANCEL" if order.order_type == OrderType.CANCEL else _SIDE_LABEL[order.order_side]
 
         self.inform(f"A {order_type} order is REJECTED for security {order.market.item} for 1 unit @ {order.price}")
 
@@ -226,16 +239,14 @@ class CAPMBot(Agent):
                 if curr_order.mine:
                     if curr_order.traded_order:
                         self._order_on_market = False
-                        self._current_wait_time = 0
+                        self._last_action_time = time.monotonic()
 
                         # Informs the user of a traded order
                         consumed_order = curr_order
+                        self._my_open_orders.pop(consumed_order.fm_id, None)
+                        self._my_traded_order_ids.add(consumed_order.fm_id)
                         traded_price = consumed_order.price
-
-                        if consumed_order.order_side == OrderSide.BUY:
-                            traded_side = "BUY"
-                        else:
-                            traded_side = "SELL"
+                        traded_side = _SIDE_LABEL[consumed_order.order_side]
 
                         self.inform(f"A {traded_side} order is TRADED for the security {consumed_order.market.item}"
                                     f" for 1 unit @ {traded_price}")
@@ -247,16 +258,14 @@ class CAPMBot(Agent):
                 if curr_order.traded_order:
                     if curr_order.traded_order.mine:
                         self._order_on_market = False
-                        self._current_wait_time = 0
+                        self._last_action_time = time.monotonic()
 
                         # Informs the user of a traded order
                         consumed_order = curr_order.traded_order
+                        self._my_open_orders.pop(consumed_order.fm_id, None)
+                        self._my_traded_order_ids.add(consumed_order.fm_id)
                         traded_price = consumed_order.price
-
-                        if consumed_order.order_side == OrderSide.BUY:
-                            traded_side = "BUY"
-                        else:
-                            traded_side = "SELL"
+                        traded_side = _SIDE_LABEL[consumed_order.order_side]
 
                         self.inform(f"A {traded_side} order is TRADED for the security {consumed_order.market.item}"
                                     f" for 1 unit @ {traded_price}")
@@ -264,37 +273,40 @@ class CAPMBot(Agent):
                         return None
 
             # Cancel order if wait time for order exceeds the maximum wait time
-            if self._current_wait_time > self._max_wait_time:
-                for order_id, order in Order.current().items():
-                    if order.mine:
-                        self._cancel_order(order)
+            if self._wait_time_exceeded():
+                for order in list(self._my_open_orders.values()):
+                    self._cancel_order(order)
 
+                self._my_open_orders.clear()
                 self._order_on_market = False
-                self._current_wait_time = 0
+                self._last_action_time = time.monotonic()
 
             return None
 
+        # Snapshot of the order book shared by every decision made on this call
+        snapshot = list(Order.current().items())
+
         # Trades performance maximizing valid market order if portfolio is not optimal
-        optimal_achieved = self.is_portfolio_optimal()
+        optimal_achieved = self.is_portfolio_optimal(snapshot)
 
         if not optimal_achieved:
             optimal_trade = self._most_enhancing_trade
             self.send_order(optimal_trade)
             self._order_on_market = True
-            self._current_wait_time = 0
+            self._last_action_time = time.monotonic()
 
         # Trades performance maximizing market making order if portfolio is not optimal and current wait time has
         # exceeded max wait time
         else:
-            if self._current_wait_time > self._max_wait_time:
+            if self._wait_time_exceeded():
 
-                market_making_optimal = self._market_making_portfolio_optimal()
+                market_making_optimal = self._market_making_portfolio_optimal(snapshot)
 
                 if not market_making_optimal:
                     optimal_trade = self._most_enhancing_trade
                     self.send_order(optimal_trade)
                     self._order_on_market = True
-                    self._current_wait_time = 0
+                    self._last_action_time = time.monotonic()
 
     def received_session_info(self, session: Session):
 
@@ -306,9 +318,15 @@ class CAPMBot(Agent):
 
     def pre_start_tasks(self):
 
-        # Initializes the maximum and tick times for wait times (in seconds). Max wait time is 0.5% of session time
+        # Initializes the maximum wait time (in seconds) and starts the wait timer. Max wait time is 0.5% of session
+        # time
         self._max_wait_time = (self._session_time * 60) // 200
-        self.execute_periodically(self._increment_current_wait_time, 1)
+        self._last_action_time = time.monotonic()
+
+        # Compiles the candidate trade search before trading starts
+        prices = np.zeros(1, dtype=np.int64)
+        valid = np.zeros(1, dtype=np.bool_)
+        _best_candidate(np.zeros(1), np.zeros(1), np.zeros(1), prices, valid, prices, valid)
 
         # And his name is ... JOHN CENA!!!
         self.inform("John Cena Bot is ONLINE! (╯°□°)╯")
@@ -328,8 +346,19 @@ class CAPMBot(Agent):
         if self._current_performance is None:
             self._initialize_asset_properties()
 
-        # Update current portfolio performance
-        self._current_performance = self.get_potential_performance(list())
+        for security, sec_idx in self._sec_index.items():
+            self._h_vec[sec_idx] = self._asset_holdings[security]
+            self._short_vec[sec_idx] = self._short_asset_holdings[security]
+
+        # Update current portfolio performance, reusing the last result if cash and asset holdings are unchanged
+        cache_key = (self._cash_holdings, self._h_vec.tobytes())
+        if cache_key != self._perf_cache_key:
+            self._refresh_portfolio_state()
+            self._perf_cache_key = cache_key
+            self._perf_cache_val = (self._cash_holdings * 0.01 + self._base_expected_return
+                                    - self._risk_penalty * self._base_variance)
+
+        self._current_performance = self._perf_cache_val
 
         if not self._order_on_market:
             self.inform(f"Portfolio performance is now {self._current_performance:.3f}")
@@ -340,16 +369,16 @@ class CAPMBot(Agent):
         :return: None. Sends a market making order request to the market
         """
 
-        if self._current_wait_time > self._max_wait_time:
+        if self._wait_time_exceeded():
             if not self._order_on_market:
 
-                market_making_optimal = self._market_making_portfolio_optimal()
+                market_making_optimal = self._market_making_portfolio_optimal(list(Order.current().items()))
 
                 if not market_making_optimal:
                     optimal_trade = self._most_enhancing_trade
                     self.send_order(optimal_trade)
                     self._order_on_market = True
-                    self._current_wait_time = 0
+                    self._last_action_time = time.monotonic()
 
     def _initialize_asset_properties(self):
         """
@@ -357,184 +386,209 @@ class CAPMBot(Agent):
         :return: None. Mutates asset expected return and the variance/covariance matrix variables.
         """
 
-        expected_return = {}
-        variance_covariance_matrix = {}
-
-        # Expected return
-        for security, payoff_dist in self._payoffs.items():
-            curr_return = 0
-
-            for state in payoff_dist:
-                curr_return += state / 100
-            expected_return[security] = (curr_return / len(payoff_dist))
-
-        # Variance/Covariance Matrix
-        for first_security in self._payoffs.keys():
-            for second_security in self._payoffs.keys():
+        # Array representations of the security attributes, indexed by position in self._securities
+        self._securities = list(self._payoffs)
+        self._sec_index = {security: index for index, security in enumerate(self._securities)}
 
-                curr_matrix = 0
+        # Asset holdings and asset holdings including amount that can be shorted, mirrored from received_holdings
+        self._h_vec = np.zeros(len(self._securities), dtype=np.int64)
+        self._short_vec = np.zeros(len(self._securities), dtype=np.int64)
 
-                first_security_payoff = self._payoffs[first_security]
-                second_security_payoff = self._payoffs[second_security]
-                state_num = len(first_security_payoff)
-                state_probability = 1 / state_num
+        # Payoff of each security (rows) in each state (columns). States are equally likely
+        payoffs = np.vstack([self._payoffs[security] for security in self._securities]).astype(np.float64) / 100.0
+        state_num = payoffs.shape[1]
 
-                for state in range(state_num):
-                    first_security_diff = (first_security_payoff[state] / 100) - expected_return[first_security]
-                    second_security_diff = (second_security_payoff[state] / 100) - expected_return[second_security]
+        # Expected return
+        self._mu = payoffs.mean(axis=1)
 
-                    curr_matrix += state_probability * (first_security_diff * second_security_diff)
-                variance_covariance_matrix[(first_security, second_security)] = curr_matrix
+        # Variance/Covariance Matrix (Fortran ordered so BLAS symmetric routines can use it without a copy)
+        deviations = payoffs - self._mu[:, None]
+        self._cov = np.asfortranarray((deviations @ deviations.T) / state_num)
+        self._diag = np.diag(self._cov).copy()
 
-        # Updating the security attributes
-        self._asset_expected_returns = expected_return
-        self._asset_variance_covariance_matrix = variance_covariance_matrix
+        # Price floor, ceiling, and tick
+        self._floor_vec = np.array([self._price_floor[security] for security in self._securities], dtype=np.int64)
+        self._ceiling_vec = np.array([self._price_ceiling[security] for security in self._securities], dtype=np.int64)
+        self._tick_vec = np.array([self._price_tick[security] for security in self._securities], dtype=np.int64)
 
-    def _check_order_validity(self, order):
+    def _refresh_portfolio_state(self):
         """
-        Checks if the order is a valid order. Returns True if order is valid, False otherwise.
-        :param order: Object of class Order. Contains all relevant information for sending an order to the server
-        :return: True if order is valid, False otherwise
+        Recalculates the covariance-weighted holdings, expected return, payoff variance, and per-unit trade risk
+        penalties of the current asset holdings. Called whenever the holdings of the bot change
+        :return: None. Mutates the current portfolio state variables
         """
 
-        # Check if price exceeds price ceiling
-        if order.price > Market(self._market_ids[order.ref]).max_price:
-            return False
+        self._base_expected_return = self._mu @ self._h_vec
 
-        # Check if price exceeds price floor
-        if order.price < Market(self._market_ids[order.ref]).min_price:
-            return False
+        # Risk penalties are all zero for a risk neutral bot, so the covariance matrix is not needed
+        if self._risk_penalty == 0:
+            self._cov_h = np.zeros(len(self._securities))
+            self._base_variance = 0.0
+            self._risk_vec_buy = self._risk_vec_sell = self._cov_h
+            return
 
-        if order.order_side == OrderSide.BUY:
+        self._cov_h = dsymv(1.0, self._cov, self._h_vec, lower=1)
+        self._base_variance = self._h_vec @ self._cov_h
 
-            # Check if there is enough cash
-            if order.price > self._cash_holdings:
-                return False
+        # Var(h + s * e_i) - Var(h) = 2 * s * (Cov @ h)[i] + Cov[i, i], scaled by the penalty for risk
+        self._risk_vec_buy = self._risk_penalty * (2 * self._cov_h + self._diag)
+        self._risk_vec_sell = self._risk_penalty * (self._diag - 2 * self._cov_h)
 
-        if order.order_side == OrderSide.SELL:
+    def _check_order_validity(self, buy_prices, sell_prices):
+        """
+        Checks which single unit buy and sell trades are valid at the given prices
+        :param buy_prices: Array of prices (in cents) at which 1 unit of each security would be bought
+        :param sell_prices: Array of prices (in cents) at which 1 unit of each security would be sold
+        :return: Tuple of arrays (buy valid, sell valid) that are True where the trade is valid
+        """
 
-            # Check if there is enough securities
-            security = order.ref
-            if order.units > self._short_asset_holdings[security]:
-                return False
+        # Check if price is within the price floor and price ceiling
+        buy_valid = (buy_prices >= self._floor_vec) & (buy_prices <= self._ceiling_vec)
+        sell_valid = (sell_prices >= self._floor_vec) & (sell_prices <= self._ceiling_vec)
 
-        return True
+        # Check if there is enough cash
+        buy_valid &= buy_prices <= self._cash_holdings
 
-    def _increment_current_wait_time(self):
-        """
-        Increments the variable self._current_wait_time by 1 every second
-        :return: None. Mutates self._current_wait_time instead
-        """
+        # Check if there is enough securities
+        sell_valid &= self._short_vec >= 1
 
-        self._current_wait_time += 1
+        return buy_valid, sell_valid
 
-    def _cancel_order(self, order):
+    def _wait_time_exceeded(self):
         """
-        Cancels existing orders on the market that is sent by the bot
-        :param order: Object of class Order that is to be canceled
-        :return: None. Sends a request to the market to cancel an order
+        Checks if the time since the bot last sent, traded, or canceled an order exceeds the maximum wait time
+        :return: True if the maximum wait time is exceeded, False otherwise
         """
 
-        cancel_order = copy.copy(order)
-        cancel_order.order_type = OrderType.CANCEL
-        self.send_order(cancel_order)
+        return (time.monotonic() - self._last_action_time) > self._max_wait_time
 
-    def _market_making_portfolio_optimal(self):
+    def _price_vector(self, price_dict, default_prices=None):
         """
-        A market maker type bot that is called if there is insufficient liquidity in the order book. It calculates
-        portfolio performance if orders are sent that is 1 price tick better than current market prices
-        :return: Return True if portfolio is optimal even when the market making orders are sent, False otherwise
+        Converts a dictionary of prices into an array indexed by position in self._securities
+        :param price_dict: Dictionary with securities as keys and prices (in cents) as values
+        :param default_prices: Array of prices for securities missing from price_dict. If None, missing securities are
+        marked as unavailable
+        :return: Tuple of arrays (prices, available)
         """
 
-        # Find best bid/ask price for each market
-        best_bid_dict = {}
-        best_ask_dict = {}
+        if default_prices is None:
+            prices = np.zeros(len(self._securities), dtype=np.int64)
+            available = np.zeros(len(self._securities), dtype=np.bool_)
+        else:
+            prices = default_prices.copy()
+            available = np.ones(len(self._securities), dtype=np.bool_)
 
-        for order_id, order in Order.current().items():
-            security = order.market.item
-            price = order.price
+        for security, price in price_dict.items():
+            sec_idx = self._sec_index[security]
+            prices[sec_idx] = price
+            available[sec_idx] = True
 
-            if order.order_side == OrderSide.SELL:
-                if best_ask_dict.get(security) is None:
-                    best_ask_dict[security] = price
-                else:
-                    if price < best_ask_dict[security]:
-                        best_ask_dict[security] = price
-
-            if order.order_side == OrderSide.BUY:
-                if best_bid_dict.get(security) is None:
-                    best_bid_dict[security] = price
-                else:
-                    if price > best_bid_dict[security]:
-                        best_bid_dict[security] = price
-
-        # Populates the best bid/ask dictionary with min/max price for securities with no prices
-        for market_id, market_info in self.markets.items():
-            security = market_info.item
-            max_price = market_info.max_price
-            min_price = market_info.min_price
+        return prices, available
+
+    def _select_trade(self, buy_prices, buy_available, sell_prices, sell_available):
+        """
+        Finds the most performance increasing valid single unit trade at the given prices. Mutates the variable
+        self._most_enhancing_trade with the trade, or None if no valid trade increases performance
+        :param buy_prices: Array of prices (in cents) at which 1 unit of each security can be bought
+        :param buy_available: Array that is True for securities that can be bought
+        :param sell_prices: Array of prices (in cents) at which 1 unit of each security can be sold
+        :param sell_available: Array that is True for securities that can be sold
+        :return: Return True if no valid trade increases performance, False otherwise
+        """
 
-            if best_bid_dict.get(security) is None:
-                best_bid_dict[security] = min_price
+        # Only valid trades on available prices are considered
+        buy_valid, sell_valid = self._check_order_validity(buy_prices, sell_prices)
+        buy_valid &= buy_available
+        sell_valid &= sell_available
 
-            if best_ask_dict.get(security) is None:
-                best_ask_dict[security] = max_price
+        margin, side, sec_idx = _best_candidate(self._mu, self._risk_vec_buy, self._risk_vec_sell, buy_prices,
+                                                buy_valid, sell_prices, sell_valid)
 
-        # Finds all performance increasing trades that is 1 price tick better than current market prices
-        optimal_trades = {}
+        # Only a trade with a positive marginal performance increases portfolio performance
+        self._most_enhancing_trade = None
+        if side != 0 and margin > _MIN_MARGIN:
+            trade_prices = buy_prices if side == _BUY_SIGN else sell_prices
+            self._most_enhancing_trade = self._create_limit_order(self._securities[sec_idx],
+                                                                  int(trade_prices[sec_idx]), _SIDE_BY_SIGN[side])
 
-        # Determines if buying 1 more security at 1 price tick above market bid increases performance
-        for security, price in best_bid_dict.items():
+        return self._most_enhancing_trade is None
 
-            buy_order = Order.create_new()
-            buy_order.price = price + self._price_tick[security]
-            buy_order.order_side = OrderSide.BUY
-            buy_order.ref = security
+    def _create_limit_order(self, security, price, order_side):
+        """
+        Creates a 1 unit limit order for a security
+        :param security: Security to be traded
+        :param price: Price of the order (in cents)
+        :param order_side: Side of the order (i.e. OrderSide.BUY or OrderSide.SELL)
+        :return: Object of class Order ready to be sent to the market
+        """
 
-            performance = self.get_potential_performance([buy_order])
-            if performance > self._current_performance:
-                optimal_trades[performance] = buy_order
+        order = Order.create_new()
+        order.market = self._markets_by_sec[security]
+        order.ref = security
+        order.price = price
+        order.units = 1
+        order.order_side = order_side
+        order.order_type = OrderType.LIMIT
 
-        # Determines if selling 1 more security at 1 price tick below market ask increases performance
-        for security, price in best_ask_dict.items():
+        return order
 
-            sell_order = Order.create_new()
-            sell_order.price = price - self._price_tick[security]
-            sell_order.order_side = OrderSide.SELL
-            sell_order.ref = security
+    def _best_bid_ask(self, snapshot):
+        """
+        Finds the best bid and best ask price for each security with orders on the order book
+        :param snapshot: List of (order id, order) pairs of the current order book
+        :return: Tuple of dictionaries (best bid, best ask) with securities as keys and prices as values
+        """
 
-            performance = self.get_potential_performance([sell_order])
-            if performance > self._current_performance:
-                optimal_trades[performance] = sell_order
+        best_bid_dict = {}
+        best_ask_dict = {}
 
-        # Finds the best performance enhancing market maker trade that satisfies order validity if there are any
-        if len(optimal_trades) != 0:
+        for order_id, order in snapshot:
+            security = order.market.item
+            price = order.price
 
-            best_market_maker_performance = 0
-            best_market_maker_trade = None
+            # Lowest sell price is the best ask, highest buy price is the best bid
+            if order.order_side is OrderSide.SELL:
+                best_ask_dict[security] = price if (prev := best_ask_dict.get(security)) is None else min(price, prev)
+            else:
+                best_bid_dict[security] = price if (prev := best_bid_dict.get(security)) is None else max(price, prev)
 
-            for performance, trade in optimal_trades.items():
-                if performance > best_market_maker_performance:
+        return best_bid_dict, best_ask_dict
 
-                    # Populates the rest of the parameters for the order
-                    trade.market = Market(self._market_ids[trade.ref])
-                    trade.order_type = OrderType.LIMIT
-                    trade.units = 1
+    def _cancel_order(self, order):
+        """
+        Cancels existing orders on the market that is sent by the bot
+        :param order: Object of class Order that is to be canceled
+        :return: None. Sends a request to the market to cancel an order
+        """
 
-                    # Checking for order validity
-                    valid_order = self._check_order_validity(trade)
+        cancel_order = Order.create_new()
+        cancel_order.fm_id = order.fm_id
+        cancel_order.ref = order.ref
+        cancel_order.market = order.market
+        cancel_order.price = order.price
+        cancel_order.units = order.units
+        cancel_order.order_side = order.order_side
+        cancel_order.order_type = OrderType.CANCEL
+        self.send_order(cancel_order)
 
-                    if valid_order:
+    def _market_making_portfolio_optimal(self, snapshot):
+        """
+        A market maker type bot that is called if there is insufficient liquidity in the order book. It calculates
+        portfolio performance if orders are sent that is 1 price tick better than current market prices
+        :param snapshot: List of (order id, order) pairs of the current order book
+        :return: Return True if portfolio is optimal even when the market making orders are sent, False otherwise
+        """
 
-                        best_market_maker_performance = performance
-                        best_market_maker_trade = trade
+        # Find best bid/ask price for each market
+        best_bid_dict, best_ask_dict = self._best_bid_ask(snapshot)
 
-            if best_market_maker_trade is not None:
-                self._most_enhancing_trade = best_market_maker_trade
-                return False
+        # Buy 1 price tick above market bid or sell 1 price tick below market ask, using min/max price for securities
+        # with no prices
+        bid_prices, bid_available = self._price_vector(best_bid_dict, self._floor_vec)
+        ask_prices, ask_available = self._price_vector(best_ask_dict, self._ceiling_vec)
 
-        self._most_enhancing_trade = None
-        return True
+        return self._select_trade(bid_prices + self._tick_vec, bid_available, ask_prices - self._tick_vec,
+                                  ask_available)
 
 
 if __name__ == "__main__":